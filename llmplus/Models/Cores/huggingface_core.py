@@ -1,8 +1,12 @@
 import os
+import torch
+import weakref
 from transformers import StoppingCriteria, StoppingCriteriaList
 from langchain.callbacks.manager import CallbackManagerForLLMRun
 from .base_core import BaseCore, BaseLLM
-from typing import Optional, List, Dict, Any, Union, Iterator, Literal
+from typing import Optional, List, Dict, Any, Union, Iterator, Literal, Tuple
+
+_stop_ids_cache: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
 
 class KeywordsStoppingCriteria(StoppingCriteria):
     '''class for handling stop words in transformers.pipeline'''
@@ -10,41 +14,70 @@ class KeywordsStoppingCriteria(StoppingCriteria):
         self.tokenizer = tokenizer
         self.stopwords = stop_words
         self.stop_ids = list(map(lambda x: self.get_min_ids(x), stop_words))
+        self._max_len = max(map(len, self.stop_ids)) if len(self.stop_ids) != 0 else 0
 
     def __call__(self, input_ids: Any, scores: Any, **kwargs) -> bool:
-        input_list = input_ids[0].tolist()
+        if self._max_len == 0:
+            return False
+        tail = input_ids[0, -self._max_len:].tolist()
         for i in self.stop_ids:
-            last = len(i)
-            if len(input_list) >= last:
-                comp = input_list[-last:]
-                if comp==i:
-                    return True
+            if ((len(tail) >= len(i)) and (tail[-len(i):] == i)):
+                return True
         return False
     
     def get_min_ids(self, word: str) -> List[int]:
+        cache = _stop_ids_cache.setdefault(self.tokenizer, dict())
+        if word not in cache:
+            cache[word] = self._get_min_ids(word)
+        return cache[word]
+
+    def _get_min_ids(self, word: str) -> List[int]:
         ids = self.tokenizer.encode(word, add_special_tokens=False)
-        effective = list()
-        for i in range(len(ids)):
-            temp = ids[i:]
-            text = self.tokenizer.decode(temp)
-            if text==word:
-                effective.append((text, temp))
-            else:
-                break
-        for i in range(len(ids)):
-            temp = ids[:-i]
-            text = self.tokenizer.decode(temp)
-            if text==word:
-                effective.append((text, temp))
+        if self.tokenizer.decode(ids) != word:
+            return ids
+        suffix = self._min_slice(ids, word, from_end=True)
+        prefix = self._min_slice(ids, word, from_end=False)
+        return suffix if len(suffix) <= len(prefix) else prefix
+
+    def _min_slice(self, ids: List[int], word: str, from_end: bool = True) -> List[int]:
+        """Binary search of the shortest suffix (or prefix) of the token ids that still decodes to the word. The full list of ids must decode to the word.
+
+        Args:
+            ids (List[int]): Token ids of the word.
+            word (str): The stop word.
+            from_end (bool, optional): Whether to search for a suffix or a prefix. Defaults to True.
+
+        Returns:
+            List[int]: Shortest slice of ids found that decodes to the word.
+        """
+        take = (lambda k: ids[-k:]) if from_end else (lambda k: ids[:k])
+        low, high = 1, len(ids)
+        while low < high:
+            mid = (low + high) // 2
+            if self.tokenizer.decode(take(mid)) == word:
+                high = mid
             else:
-                break
-        effective.sort(key=lambda x: len(x[1]))
-        return effective[0][1]
+                low = mid + 1
+        return take(high)
+
+class CancelStoppingCriteria(StoppingCriteria):
+    '''class for stopping a generation from another thread, e.g. when a stream is abandoned by the consumer'''
+    def __init__(self) -> None:
+        from threading import Event
+        self._cancelled = Event()
+
+    def cancel(self) -> None:
+        """Stop the generation at the next decoding step."""
+        self._cancelled.set()
+
+    def __call__(self, input_ids: Any, scores: Any, **kwargs) -> bool:
+        return self._cancelled.is_set()
 
 class HuggingfaceCore(BaseCore):
     """This is the core class of loading model in awq, gptq, or original format.
     """
-    def __init__(self, model_id: str, model_type: Literal['default', 'awq', 'gptq'], model_kwargs: Dict[str, Any] = dict(), tokenizer_kwargs: Dict[str, Any] = dict()) -> None:
+    def __init__(self, model_id: str, model_type: Literal['default', 'awq', 'gptq'], model_kwargs: Dict[str, Any] = dict(), tokenizer_kwargs: Dict[str, Any] = dict(),
+                 attn_implementation: Optional[Literal['eager', 'sdpa', 'flash_attention_2']] = None, compile_model: bool = False) -> None:
         """Initiating the core with transformers.
 
         Args:
@@ -52,6 +85,8 @@ class HuggingfaceCore(BaseCore):
             model_type (Literal[&#39;default&#39;, &#39;awq&#39;, &#39;gptq&#39;]): Type of model format.
             model_kwargs (Dict[str, Any], optional): Keyword arguments for loading the model. Defaults to dict().
             tokenizer_kwargs (Dict[str, Any], optional): Keyword arguments for loading the tokenizer. Defaults to dict().
+            attn_implementation (Optional[Literal[&#39;eager&#39;, &#39;sdpa&#39;, &#39;flash_attention_2&#39;]], optional): Attention implementation to load the model with. If None, transformers picks the default for the model (sdpa when supported). Defaults to None.
+            compile_model (bool, optional): Whether to compile the model's forward pass with torch.compile. A static KV cache is used for generation when the model supports it, so the shapes stay fixed across decoding steps; otherwise the default compile mode is used. The first generations will be slow while compiling, and streaming (worker thread) and non-stream (caller thread) calls each build their own graphs. Compiled kernels are cached in the TORCHINDUCTOR_CACHE_DIR (defaults to a folder in the llmplus home) for later runs. Defaults to False.
         """
         from ...utils import get_config
         os.environ['HF_HOME'] = get_config()['hf_home']
@@ -59,6 +94,7 @@ class HuggingfaceCore(BaseCore):
         self._model_id = model_id
         self._core_type = 'HuggingfaceCore'
         self._model_type = model_type
+        self._generation_executor = None
 
         if not hasattr(tokenizer_kwargs, 'pretrained_model_name_or_path'):
             tokenizer_kwargs['pretrained_model_name_or_path'] = model_id
@@ -66,9 +102,19 @@ class HuggingfaceCore(BaseCore):
 
         if not hasattr(model_kwargs, 'device_map'):
             model_kwargs['device_map'] = 'auto'
+        if attn_implementation is not None:
+            model_kwargs['attn_implementation'] = attn_implementation
         model_kwargs['pretrained_model_name_or_path'] = model_id
         self._model = AutoModelForCausalLM.from_pretrained(**model_kwargs)
 
+        if compile_model:
+            os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', os.path.join(get_config()['llmplus_home'], 'torchinductor_cache'))
+            if getattr(self._model, '_supports_static_cache', False):
+                self._model.generation_config.cache_implementation = 'static'
+                self._model.forward = torch.compile(self._model.forward, mode='reduce-overhead', fullgraph=False)
+            else:
+                self._model.forward = torch.compile(self._model.forward, fullgraph=False)
+
     @property
     def model_type(self) -> str:
         """Format of the model.
@@ -78,25 +124,46 @@ class HuggingfaceCore(BaseCore):
         """
         return self._model_type
     
+    @property
+    def generation_executor(self) -> Any:
+        """Single worker executor to run streaming generations in the background. The worker thread is created on the first job and reused afterwards.
+
+        Returns:
+            Any: The ThreadPoolExecutor of the core.
+        """
+        if self._generation_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._generation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='llmplus_generation')
+        return self._generation_executor
+    
     def unload(self) -> None:
         """Unload the model from ram."""
-        device = self._model.device
+        import gc
+        if self._generation_executor is not None:
+            self._generation_executor.shutdown(wait=True)
+            self._generation_executor = None
+        device_type = self._model.device.type
         del self._model
         self._model = None
         del self._tokenizer
         self._tokenizer = None
-        if 'cuda' in device:
-            import torch
+        gc.collect()
+        if device_type == 'cuda':
             torch.cuda.empty_cache()
+            torch.cuda.ipc_collect()
     
 class HuggingfaceLLM(BaseLLM):
     '''Custom implementation of streaming for models loaded with `llama-cpp-python`, Used in the Llm factory to get new llm from the model.'''
     core: HuggingfaceCore
     generation_config: Dict[str, Any]
     stop: List[str]
+    stop_cache: Dict[Tuple[str, ...], Any] = dict()
+    empty_cache_after_call: bool = False
+    prompt_cache: Optional[Tuple[str, Any]] = None
 
     def __init__(self, core: HuggingfaceCore, temperature: float = 0, max_new_tokens: int = 2048, top_p: float = 0.95, top_k: int = 40, 
-                 repetition_penalty: float = 1.1, stop: Optional[List[str]] = None, stop_newline_version: bool = True) -> None:
+                 repetition_penalty: float = 1.1, stop: Optional[List[str]] = None, stop_newline_version: bool = True,
+                 empty_cache_after_call: bool = False) -> None:
         """Initialising the llm.
 
         Args:
@@ -108,6 +175,7 @@ class HuggingfaceLLM(BaseLLM):
             repetition_penalty (float, optional): The value to penalise the model for generating repetitive text. Defaults to 1.1.
             stop (Optional[List[str]], optional): List of strings to stop the generation of the llm. Defaults to None.
             stop_newline_version (bool, optional): Whether to add duplicates of the list of stop words starting with a new line character. Defaults to True.
+            empty_cache_after_call (bool, optional): Whether to release the cached CUDA memory after each generation. Useful when running multiple models or with limited VRAM, at the cost of some latency. Defaults to False.
         """
         from .utils import get_stop_words
         stop = get_stop_words(stop, core.tokenizer, stop_newline_version, 'transformers')
@@ -125,6 +193,42 @@ class HuggingfaceLLM(BaseLLM):
         self.generation_config = generation_config
         self.core = core
         self.stop = stop
+        self.empty_cache_after_call = empty_cache_after_call
+
+    def _release_memory(self) -> None:
+        """Release the cached CUDA memory if `empty_cache_after_call` is set."""
+        if ((self.empty_cache_after_call) & (self.core.model.device.type == 'cuda')):
+            torch.cuda.empty_cache()
+
+    def _to_device(self, ids: Any) -> Any:
+        """Move token ids to the model device. On CUDA, the ids are copied from pinned memory asynchronously.
+
+        Args:
+            ids (Any): Token ids tensor on cpu.
+
+        Returns:
+            Any: Token ids tensor on the model device.
+        """
+        device = self.core.model.device
+        if device.type == 'cuda':
+            return ids.pin_memory().to(device, non_blocking=True)
+        return ids.to(device)
+
+    def _tokenize_prompt(self, prompt: str) -> Any:
+        """Tokenize the prompt and move the ids to the model device. The ids of the last prompt are kept, so the same prompt is not tokenized again.
+
+        Args:
+            prompt (str): The prompt to the llm.
+
+        Returns:
+            Any: Token ids tensor of the prompt.
+        """
+        cached = self.prompt_cache
+        if ((cached is not None) and (cached[0] == prompt)):
+            return cached[1]
+        tokens = self._to_device(self.core.tokenizer(prompt, return_tensors='pt').input_ids)
+        self.prompt_cache = (prompt, tokens)
+        return tokens
 
     def _call(
         self,
@@ -152,7 +256,10 @@ class HuggingfaceLLM(BaseLLM):
         stop = get_stop_words(stop, tokenizer=self.core.tokenizer, add_newline_version=False, tokenizer_type='transformers') if stop is not None else self.stop
         stream = kwargs.get('stream', False)
         gen_config = self.generation_config.copy()
-        gen_config['stopping_criteria'] = StoppingCriteriaList([KeywordsStoppingCriteria(stop, self.core.tokenizer)])
+        stop_key = tuple(sorted(stop))
+        if stop_key not in self.stop_cache:
+            self.stop_cache[stop_key] = StoppingCriteriaList([KeywordsStoppingCriteria(stop, self.core.tokenizer)])
+        gen_config['stopping_criteria'] = self.stop_cache[stop_key]
         for k, v in kwargs.items():
             if k == 'temperature':
                 if v > 0:
@@ -165,35 +272,50 @@ class HuggingfaceLLM(BaseLLM):
                 gen_config[k] = v
                 
         if stream:
-            from threading import Thread
             from transformers import TextIteratorStreamer
             gen_config['streamer'] = TextIteratorStreamer(tokenizer=self.core.tokenizer, skip_prompt=True)
+            canceller = CancelStoppingCriteria()
+            gen_config['stopping_criteria'] = StoppingCriteriaList(list(gen_config['stopping_criteria']) + [canceller])
             
             def pipe(prompt):
-                tokens = self.core.tokenizer(
-                    prompt,
-                    return_tensors='pt'
-                ).input_ids.to(self.core.model.device)
-                output = self.core.model.generate(tokens, **gen_config)
+                try:
+                    tokens = self._tokenize_prompt(prompt)
+                    with torch.inference_mode():
+                        output = self.core.model.generate(tokens, **gen_config)
+                    del tokens, output
+                except Exception:
+                    gen_config['streamer'].end()
+                    raise
             
-            trd = Thread(target=pipe, args=[prompt])
             def generate():
-                trd.start()
-                for i in gen_config['streamer']:
-                    yield i
-                trd.join()
-                yield ''
+                from concurrent.futures import wait
+                job = self.core.generation_executor.submit(pipe, prompt)
+                try:
+                    for i in gen_config['streamer']:
+                        yield i
+                    job.result()
+                    yield ''
+                finally:
+                    if not job.done():
+                        canceller.cancel()
+                        if not job.cancel():
+                            wait([job])
+                    self._release_memory()
             return textgen_iterator(generate(), stop=stop)
         
         else:
             from langchain.llms.utils import enforce_stop_tokens
             def pipe(prompt):
-                tokens = self.core.tokenizer(
-                    prompt,
-                    return_tensors='pt'
-                ).input_ids.to(self.core.model.device)
-                output = self.core.model.generate(tokens, **gen_config)
-                return self.core.tokenizer.decode(output[0], skip_special_tokens=True).removeprefix(prompt)
+                tokens = self._tokenize_prompt(prompt)
+                input_len = tokens.shape[1]
+                output = None
+                try:
+                    with torch.inference_mode():
+                        output = self.core.model.generate(tokens, **gen_config)
+                    return self.core.tokenizer.decode(output[0, input_len:], skip_special_tokens=True)
+                finally:
+                    del tokens, output
+                    self._release_memory()
 
             output = pipe(prompt)
             output = enforce_stop_tokens(output, stop)
@@ -90,7 +90,7 @@ class LlmFactory:
     
     def __call__(self, temperature: float = 0.8, max_new_tokens: int = 2048, top_p: float = 0.95,
                 top_k: int = 40, repetition_penalty: float = 1.1, stop: Optional[List[str]] = None, 
-                newline=True, **kwargs: Dict[str, Any]) -> BaseLLM:
+                newline=True, empty_cache_after_call: bool = False, **kwargs: Dict[str, Any]) -> BaseLLM:
         """Calling the object will create a langchain format llm with the generation configurations passed from the arguments. 
 
         Args:
@@ -101,17 +101,18 @@ class LlmFactory:
             repetition_penalty (float, optional): The value to penalise the model for generating repetitive text. Defaults to 1.1.
             stop (Optional[List[str]], optional): List of strings to stop the generation of the llm. Defaults to None.
             newline (bool, optional): Whether to add a newline character to the beginning of the "stop" list provided. Defaults to True.
+            empty_cache_after_call (bool, optional): Whether to release the cached CUDA memory after each generation. Only used by models loaded with transformers. Defaults to False.
 
         Returns:
             Type[BaseLLM]: An LLM.
         """
         return self.call(temperature=temperature, max_new_tokens=max_new_tokens,
                           top_p=top_p, top_k=top_k, repetition_penalty=repetition_penalty,
-                          stop=stop, newline=newline, **kwargs)
+                          stop=stop, newline=newline, empty_cache_after_call=empty_cache_after_call, **kwargs)
     
     def call(self, temperature: float = 0.8, max_new_tokens: int = 2048, top_p: float = 0.95,
                 top_k: int = 40, repetition_penalty: float = 1.1, stop: Optional[List[str]] = None, 
-                newline=True, **kwargs: Dict[str, Any]) -> Type[BaseLLM]:
+                newline=True, empty_cache_after_call: bool = False, **kwargs: Dict[str, Any]) -> Type[BaseLLM]:
         """Calling the object will create a langchain format llm with the generation configurations passed from the arguments. 
 
         Args:
@@ -122,6 +123,7 @@ class LlmFactory:
             repetition_penalty (float, optional): The value to penalise the model for generating repetitive text. Defaults to 1.1.
             stop (Optional[List[str]], optional): List of strings to stop the generation of the llm. Defaults to None.
             newline (bool, optional): Whether to add a newline character to the beginning of the "stop" list provided. Defaults to True.
+            empty_cache_after_call (bool, optional): Whether to release the cached CUDA memory after each generation. Only used by models loaded with transformers. Defaults to False.
 
         Returns:
             BaseLLM: An LLM.
@@ -133,7 +135,8 @@ class LlmFactory:
         elif self.model_type in ['default', 'awq', 'gptq']:
             from ..Cores.huggingface_core import HuggingfaceLLM
             return HuggingfaceLLM(core=self.core, temperature=temperature, max_new_tokens=max_new_tokens, 
-                                 top_p=top_p, top_k=top_k, repetition_penalty=repetition_penalty, stop=stop, stop_newline_version=newline)
+                                 top_p=top_p, top_k=top_k, repetition_penalty=repetition_penalty, stop=stop, stop_newline_version=newline,
+                                 empty_cache_after_call=empty_cache_after_call)
         elif self.model_type == 'openai':
             from ..Cores.openai_core import OpenAILLM
             return OpenAILLM(core=self.core, temperature=temperature, max_new_tokens=max_new_tokens, 
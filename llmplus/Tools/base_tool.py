@@ -1,6 +1,9 @@
 from ..Prompts.prompt_template import PromptTemplate
 from ..Models.Cores.base_core import BaseLLM
 from typing import List, Iterator, Optional, Union, Type
+import re
+
+_whitespaces = re.compile(r'\s+')
 
 class BaseTool:
     """This is a base class for callables for LLMs.
@@ -28,9 +31,9 @@ class BaseTool:
         Returns:
             str: Description of the tool.
         """
-        import re
-        newlines = re.compile(r'[\s\r\n\t]+')
-        return newlines.sub(' ', self._description)
+        if not hasattr(self, '_clean_description'):
+            self._clean_description = _whitespaces.sub(' ', self._description)
+        return self._clean_description
     
     def run(self, tool_input: str, llm: Optional[Type[BaseLLM]] = None, stream: bool = False, 
             history: Optional[List[List[str]]] = None, prompt_template: Optional[PromptTemplate] = None, **kwargs) -> Union[str, Iterator[str]]:
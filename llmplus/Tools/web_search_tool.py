@@ -2,6 +2,7 @@ from ..Models.Cores.base_core import BaseLLM
 from ..Prompts.prompt_template import PromptTemplate
 from ..Embeddings.base_embeddings import BaseEmbeddingsToolkit
 from .base_tool import BaseTool
+import re
 from typing import Iterator, List, Dict, Any, Optional, Union, Literal, Type
 
 WEB_SEARCH_TOOL_DESCRIPTION = """This tool is for doing searches on the internet for facts or most updated information via a search engine.
@@ -19,6 +20,41 @@ Relevant chunks of contents:
 
 """
 
+_ddgs = None
+_query_value = re.compile(r'((?:[^"\\]|\\.)*)"')
+
+def get_ddgs() -> Any:
+    """Get the shared DuckDuckGo search client, created on first use so its http client and connections are reused across searches.
+
+    Returns:
+        Any: The DDGS instance.
+    """
+    global _ddgs
+    if _ddgs is None:
+        from duckduckgo_search import DDGS
+        _ddgs = DDGS()
+    return _ddgs
+
+def extract_search_query(text: str) -> Optional[str]:
+    """Extract the search query from the llm output that continues the string value of `{"Search query": "`. Only the string value up to its closing quote is parsed, so a missing or truncated `}` does not fail the extraction.
+
+    Args:
+        text (str): Output of the llm.
+
+    Returns:
+        Optional[str]: The search query, or None if no valid query can be extracted.
+    """
+    import json
+    match = _query_value.match(text)
+    if match is None:
+        return None
+    try:
+        query = json.loads('"' + match.group(1) + '"')
+    except ValueError:
+        return None
+    query = query.strip(' \n\r\t')
+    return query if query != '' else None
+
 def ddg_search(query: str, n: int = 5, urls_only: bool = True, **kwargs) -> List[Union[str, Dict[str, Any]]]:
     """Search with DuckDuckGo.
 
@@ -30,11 +66,10 @@ def ddg_search(query: str, n: int = 5, urls_only: bool = True, **kwargs) -> List
     Returns:
         List[Union[str, Dict[str, Any]]]: List of search results.
     """
-    from duckduckgo_search import DDGS
-    with DDGS() as ddgs:
-        results = [r for r in ddgs.text(query, max_results=n, **kwargs)]
+    from itertools import islice
+    results = list(islice(get_ddgs().text(query, max_results=n, **kwargs), n))
     if urls_only:
-        results = list(map(lambda x: x['href'], results))
+        results = [r['href'] for r in results]
     return results
 
 def parse_url(url: str, timeout: int = 10) -> str:
@@ -47,17 +82,20 @@ def parse_url(url: str, timeout: int = 10) -> str:
     Returns:
         str: Content of the URL as markdown.
     """
-    import requests
-    from fake_useragent import UserAgent
     from markdownify import markdownify
+    from .web_search_utils import get_session, get_user_agent, get_cached_content, set_cached_content
     
-    ua = UserAgent()
-    response = requests.get(url, headers={'User-Agent': ua.random}, timeout=timeout)
+    key = (url, 'parse_url')
+    content = get_cached_content(key)
+    if content is not None:
+        return content
+    response = get_session().get(url, headers={'User-Agent': get_user_agent().random}, timeout=timeout)
     if response.status_code != 200:
         return ''
     else:
-        content = response.text
-        return markdownify(content, heading_style='ATX')
+        content = markdownify(response.text, heading_style='ATX')
+        set_cached_content(key, content)
+        return content
     
 class WebSearchTool(BaseTool):
     """This is the tool class for doing web search.
@@ -79,6 +117,15 @@ class WebSearchTool(BaseTool):
         self.search_engine = search_engine
         self.embeddings = embeddings
         self.vectordb = VectorDatabase.from_empty(embeddings=self.embeddings)
+        self._embeddings_warmed_up = False
+
+    def _warmup_embeddings(self) -> None:
+        """Run a dummy embedding so the first real batch does not pay for the model's first forward pass."""
+        try:
+            self.embeddings.embedding_model.embed_query('warmup')
+            self._embeddings_warmed_up = True
+        except Exception:
+            pass
 
     def search(self, query: str, n: int = 5, urls_only: bool = True, **kwargs) -> List[Union[str, Dict[str, Any]]]:
         """Search with the given query.
@@ -114,6 +161,11 @@ class WebSearchTool(BaseTool):
         Returns:
             Union[str, Iterator[str], List[Dict[str, Any]], Any]: Search result, if llm and prompt template is provided, the result will be provided as a reponse to the tool_input.
         """
+        from threading import Thread
+        warmup = Thread(target=self._warmup_embeddings)
+        if not self._embeddings_warmed_up:
+            warmup.start()
+
         tool_input = tool_input.strip(' \n\r\t')
         if not generate_query:
             query = tool_input
@@ -131,41 +183,32 @@ class WebSearchTool(BaseTool):
             request = f'This is my latest request: {tool_input}\n\nGenerate the search query that helps you to search in the search engine and respond, in JSON format.'
             query_prompt = prompt_template.create_prompt(user=request, system=QUERY_GENERATION_SYS_RPOMPT + conversation)
             query_prompt += '```json\n{"Search query": "'
-            query = '{"Search query": "' + llm(query_prompt, stop=['```'])
-            try:
-                import json
-                query = json.loads(query)['Search query']
+            query = extract_search_query(llm(query_prompt, stop=['```']))
+            if query is not None:
                 self.print(f'Search query: {query}')
-            except:
+            else:
                 self.print(f'Generation of query failed, fall back to use the raw tool_input "{tool_input}".')
                 query = tool_input
 
-        from ..TextSplitters.llm_text_splitter import LLMTextSplitter
         from ..Models.Cores.utils import add_newline_char_to_stopwords
-        from .web_search_utils import get_markdown, create_content_chunks
-        from langchain.schema.document import Document
+        from .web_search_utils import get_markdowns, create_content_chunks, deduplicate_chunks
 
-        text_splitter = LLMTextSplitter(model=llm)
         results = self.search(query=query, urls_only=False, **kwargs)
         urls = list(map(lambda x: x['href'], results))
-        if llm is None:
-            contents = list(map(lambda x: get_markdown(x, as_list=False), urls))
-            self.print('Parsing contents completed.')
-            docs = list(map(lambda x: Document(page_content=x[0], metadata=x[1]), list(zip(contents, results))))
-            docs = text_splitter.split_documents(documents=docs)
-            index = list(map(lambda x: x.page_content, docs))
-            data = list(map(lambda x: x.metadata, docs))
-            self.print(f'Splitting contents completed. Number of documents: {len(index)}')
-        else:
-            contents = list(map(lambda x: get_markdown(x, as_list=True), urls))
-            self.print('Parsing contents completed.')
-            contents = list(map(lambda x: create_content_chunks(x, llm), contents))
-            docs = list(zip(contents, results))
-            docs = list(map(lambda x: list(map(lambda y: Document(page_content=y, metadata=x[1]), x[0])), docs))
-            docs = sum(docs, [])
-            index = list(map(lambda x: x.page_content, docs))
-            data = list(map(lambda x: x.metadata, docs))
-            self.print(f'Splitting contents completed. Number of documents: {len(index)}')
+        contents = get_markdowns(urls, as_list=llm is not None)
+        self.print('Parsing contents completed.')
+        index = []
+        data = []
+        for content, metadata in zip(contents, results):
+            if content is None:
+                continue
+            chunks = self.embeddings.text_splitter.split_text(content) if llm is None else create_content_chunks(content, llm)
+            index.extend(chunks)
+            data.extend([metadata] * len(chunks))
+        self.print(f'Splitting contents completed. Number of documents: {len(index)}')
+        index, data = deduplicate_chunks(index, data)
+        if warmup.is_alive():
+            warmup.join()
         self.vectordb.add_texts(texts=index, metadata=data, split_text=False)
         self.print('Storing contents completed.')
 
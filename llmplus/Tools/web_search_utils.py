@@ -1,6 +1,84 @@
 from bs4 import BeautifulSoup, NavigableString, Tag
 from langchain.llms.base import LLM
-from typing import Optional, List, Union
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, List, Union, Any, Dict, Tuple
+
+URL_CACHE_TTL = 600
+URL_CACHE_SIZE = 256
+
+_user_agent = None
+_session = None
+_init_lock = Lock()
+_url_cache: OrderedDict = OrderedDict()
+_url_cache_lock = Lock()
+
+def get_cached_content(key: Tuple[Any, ...]) -> Optional[Any]:
+    """Get the cached content of a URL if it was stored within the last URL_CACHE_TTL seconds.
+
+    Args:
+        key (Tuple[Any, ...]): Cache key, starting with the URL.
+
+    Returns:
+        Optional[Any]: The cached content, None if not cached or expired.
+    """
+    import time
+    with _url_cache_lock:
+        entry = _url_cache.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] >= URL_CACHE_TTL:
+            del _url_cache[key]
+            return None
+        _url_cache.move_to_end(key)
+        return entry[1]
+
+def set_cached_content(key: Tuple[Any, ...], content: Any) -> None:
+    """Store the content of a URL in the cache, evicting the least recently used entries beyond URL_CACHE_SIZE.
+
+    Args:
+        key (Tuple[Any, ...]): Cache key, starting with the URL.
+        content (Any): Content to store.
+    """
+    import time
+    with _url_cache_lock:
+        _url_cache[key] = (time.time(), content)
+        _url_cache.move_to_end(key)
+        while len(_url_cache) > URL_CACHE_SIZE:
+            _url_cache.popitem(last=False)
+
+def get_user_agent() -> Any:
+    """Get the shared fake_useragent.UserAgent instance, created on first use.
+
+    Returns:
+        Any: The UserAgent instance.
+    """
+    global _user_agent
+    if _user_agent is None:
+        with _init_lock:
+            if _user_agent is None:
+                from fake_useragent import UserAgent
+                _user_agent = UserAgent(os = ['windows', 'macos'])
+    return _user_agent
+
+def get_session() -> Any:
+    """Get the shared requests.Session with connection pooling, created on first use.
+
+    Returns:
+        Any: The requests session.
+    """
+    global _session
+    if _session is None:
+        with _init_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
 
 def get_soup_from_url(url: str, timeout: int = 8) -> BeautifulSoup:
     """Get the soup object from a URL.
@@ -12,10 +90,7 @@ def get_soup_from_url(url: str, timeout: int = 8) -> BeautifulSoup:
     Returns:
         BeautifulSoup: Soup object of the website.
     """
-    import requests
-    from fake_useragent import UserAgent
-    agent  = UserAgent(os = ['windows', 'macos'])
-    response = requests.get(url, headers={'User-agent': agent.random}, timeout=timeout)
+    response = get_session().get(url, headers={'User-agent': get_user_agent().random}, timeout=timeout)
     if response.status_code != 200:
         return BeautifulSoup('', 'html.parser')
     return BeautifulSoup(response.content, 'html.parser')
@@ -305,10 +380,53 @@ def get_markdown(url: str, timeout: int = 8, as_list: bool = False) -> Union[str
     Returns:
         Union[str, List[str]]: Content of the URL as a string or a list of string.
     """
-    soup = get_soup_from_url(url, timeout=timeout)
-    return process_element(soup, as_list=as_list)
+    key = (url, 'markdown', as_list)
+    content = get_cached_content(key)
+    if content is None:
+        soup = get_soup_from_url(url, timeout=timeout)
+        content = process_element(soup, as_list=as_list)
+        if content is not None:
+            set_cached_content(key, content)
+    return content.copy() if isinstance(content, list) else content
+
+def get_markdowns(urls: List[str], timeout: int = 8, as_list: bool = False, max_workers: int = 16) -> List[Union[str, List[str]]]:
+    """Get the contents of multiple URLs concurrently with a thread pool, preserving the order of the URLs.
 
+    Args:
+        urls (List[str]): URLs of the websites.
+        timeout (int, optional): Request timeout as seconds. Defaults to 8.
+        as_list (bool, optional): Whether to return each content as a list or as a string. Defaults to False.
+        max_workers (int, optional): Maximum number of concurrent requests. Defaults to 16.
 
-    
+    Returns:
+        List[Union[str, List[str]]]: Contents of the URLs.
+    """
+    if len(urls) == 0:
+        return []
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        contents = list(executor.map(lambda x: get_markdown(x, timeout=timeout, as_list=as_list), urls))
+    return contents
 
+def deduplicate_chunks(texts: List[str], metadata: List[Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Remove repeated text chunks, keeping the first occurrence and its metadata.
+
+    Args:
+        texts (List[str]): List of text chunks.
+        metadata (List[Dict[str, Any]]): Metadata of each text chunk.
 
+    Returns:
+        Tuple[List[str], List[Dict[str, Any]]]: Unique text chunks and their metadata.
+    """
+    import hashlib
+    seen = set()
+    unique_texts = []
+    unique_metadata = []
+    for text, meta in zip(texts, metadata):
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        if key in seen:
+            continue
+        seen.add(key)
+        unique_texts.append(text)
+        unique_metadata.append(meta)
+    return unique_texts, unique_metadata